@@ -1,8 +1,12 @@
 import os
+from functools import lru_cache
 from openai import OpenAI
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import io
 import json
+import re
 import logging
+from utils import parse_tire_size
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,6 +15,11 @@ logger = logging.getLogger(__name__)
 # Initialize OpenAI client
 client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
+# Vorkompilierte Patterns für die regelbasierte Analyse
+_FALLBACK_AUDI = re.compile(r'Audi\s+([A-Z][A-Z0-9\s]+)')
+_FALLBACK_TYPE = re.compile(r'(?:B\d+(?:,\s*B\d+)*)')
+_FALLBACK_TIRE = re.compile(r'(\d{2,3})[/-](\d{2,3})(?:ZR|R)(\d{2})')
+
 def analyze_vehicle_data(text: str) -> List[Dict]:
     """
     Analysiert den PDF-Text mit OpenAI, um Fahrzeug- und Reifenkombinationen zu extrahieren.
@@ -77,30 +86,25 @@ def fallback_analyze_vehicle_data(text: str) -> List[Dict]:
     """
     Regelbasierte Analyse als Fallback wenn KI-Analyse fehlschlägt.
     """
-    import re
     vehicles = []
     current_vehicle = None
+    name_parts = []
 
-    # Patterns für die Analyse
-    patterns = {
-        'audi_header': r'Audi\s+([A-Z][A-Z0-9\s]+)',
-        'type': r'(?:B\d+(?:,\s*B\d+)*)',
-        'tire': r'(\d{2,3})[/-](\d{2,3})(?:ZR|R)(\d{2})',
-    }
-
-    lines = text.split('\n')
-    for line in lines:
-        line = line.strip()
+    # Zeilenweise über den Text iterieren, ohne eine Liste aller Zeilen anzulegen
+    for raw_line in io.StringIO(text):
+        line = raw_line.strip()
         if not line:
             continue
 
         # Suche nach Audi Modell
-        audi_match = re.search(patterns['audi_header'], line)
+        audi_match = _FALLBACK_AUDI.search(line)
         if audi_match:
             if current_vehicle:
+                current_vehicle['fahrzeug'] = ' '.join(name_parts)
                 vehicles.append(current_vehicle)
 
             model_name = audi_match.group(1).strip()
+            name_parts = ['Audi', model_name]
             current_vehicle = {
                 'fahrzeug': f"Audi {model_name}",
                 'reifen': set()
@@ -108,40 +112,29 @@ def fallback_analyze_vehicle_data(text: str) -> List[Dict]:
             continue
 
         # Suche nach Fahrzeugtyp
-        if current_vehicle and re.search(patterns['type'], line):
-            type_info = re.search(patterns['type'], line).group(0)
-            current_vehicle['fahrzeug'] = f"{current_vehicle['fahrzeug']} {type_info}"
+        if current_vehicle and (type_match := _FALLBACK_TYPE.search(line)):
+            name_parts.append(type_match.group(0))
 
         # Suche nach Reifengrößen
         if current_vehicle:
-            tire_matches = re.finditer(patterns['tire'], line)
+            tire_matches = _FALLBACK_TIRE.finditer(line)
             for match in tire_matches:
                 tire_size = f"{match.group(1)}/{match.group(2)}R{match.group(3)}"
                 current_vehicle['reifen'].add(tire_size)
 
     # Letztes Fahrzeug hinzufügen
     if current_vehicle and len(current_vehicle['reifen']) > 0:
+        current_vehicle['fahrzeug'] = ' '.join(name_parts)
         current_vehicle['reifen'] = list(current_vehicle['reifen'])
         vehicles.append(current_vehicle)
 
     return vehicles
 
-def validate_tire_combination(vehicle: str, tire: str) -> Dict:
+def _build_validation_prompt(vehicle: str, tire: str) -> str:
     """
-    Verwendet KI um zu überprüfen, ob eine Fahrzeug-Reifen-Kombination zulässig ist.
-    Falls KI nicht verfügbar, verwendet regelbasierte Prüfung.
-
-    Args:
-        vehicle: Fahrzeugbezeichnung
-        tire: Reifengröße
-
-    Returns:
-        Dict: Status und Hinweise zur Kombination
+    Erstellt den Prompt für die Prüfung einer Fahrzeug-Reifen-Kombination.
     """
-    try:
-        logger.info(f"Prüfe Kombination: {vehicle} mit {tire}")
-
-        prompt = f"""
+    return f"""
         Bewerte die folgende Fahrzeug-Reifen-Kombination auf Zulässigkeit:
         Fahrzeug: {vehicle}
         Reifen: {tire}
@@ -153,14 +146,20 @@ def validate_tire_combination(vehicle: str, tire: str) -> Dict:
         }}
         """
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.3
-        )
+def validate_tire_combination(vehicle: str, tire: str) -> Dict:
+    """
+    Verwendet KI um zu überprüfen, ob eine Fahrzeug-Reifen-Kombination zulässig ist.
+    Falls KI nicht verfügbar, verwendet regelbasierte Prüfung.
 
-        result = json.loads(response.choices[0].message.content)
+    Args:
+        vehicle: Fahrzeugbezeichnung
+        tire: Reifengröße
+
+    Returns:
+        Dict: Status und Hinweise zur Kombination
+    """
+    try:
+        result = dict(_validate_cached(' '.join(vehicle.split()), tire.strip()))
         logger.info(f"Kombinationsprüfung erfolgreich: {result['status']}")
         return result
 
@@ -169,20 +168,37 @@ def validate_tire_combination(vehicle: str, tire: str) -> Dict:
         # Fallback zur regelbasierten Prüfung
         return fallback_validate_tire_combination(vehicle, tire)
 
+@lru_cache(maxsize=512)
+def _validate_cached(vehicle_key: str, tire: str) -> Tuple:
+    """
+    Fragt die KI-Bewertung einer Kombination ab und merkt sich das Ergebnis.
+    Fehler werden nicht zwischengespeichert, damit ein späterer Aufruf es erneut versucht.
+    """
+    logger.info(f"Prüfe Kombination: {vehicle_key} mit {tire}")
+
+    response = client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": _build_validation_prompt(vehicle_key, tire)}],
+        response_format={"type": "json_object"},
+        temperature=0.3
+    )
+
+    result = json.loads(response.choices[0].message.content)
+    return tuple(result.items())
+
 def fallback_validate_tire_combination(vehicle: str, tire: str) -> Dict:
     """
     Regelbasierte Prüfung als Fallback.
     """
     # Extrahiere Reifendimensionen
-    import re
-    match = re.match(r'(\d+)/(\d+)R(\d+)', tire)
-    if not match:
+    dimensions = parse_tire_size(tire)
+    if not dimensions:
         return {
             'status': 'Nicht zulässig',
             'hinweise': 'Ungültiges Reifenformat'
         }
 
-    width, aspect, diameter = map(int, match.groups())
+    width, aspect, diameter = dimensions
 
     # Grundlegende Plausibilitätsprüfungen
     if width < 155 or width > 335:
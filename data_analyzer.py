@@ -21,12 +21,27 @@ def analyze_vehicle_tire_combination(pdf_content: str) -> List[Dict]:
         from pdf_processor import extract_vehicle_info
         vehicles = extract_vehicle_info(pdf_content)
 
+    # Code-Beschreibungen nur einmal pro Analyse nachschlagen
+    desc_cache = {}
+    # Identische Kombinationen (gleiche Größe und Codes) nur einmal prüfen
+    verdicts = {}
+
     for vehicle in vehicles:
         for tire_info in vehicle['reifen']:
-            combination_status = validate_tire_combination(vehicle['fahrzeug'], tire_info)
+            codes = tire_info.codes
+            key = (
+                vehicle['fahrzeug'],
+                tire_info.groesse,
+                tuple(codes.get('auflagen', [])),
+                tuple(codes.get('hinweise', []))
+            )
+            combination_status = verdicts.get(key)
+            if combination_status is None:
+                combination_status = validate_tire_combination(vehicle['fahrzeug'], tire_info, desc_cache=desc_cache)
+                verdicts[key] = combination_status
             results.append({
                 'fahrzeug': vehicle['fahrzeug'],
-                'reifengroesse': tire_info['groesse'],
+                'reifengroesse': tire_info.groesse,
                 'status': combination_status['status'],
                 'hinweise': combination_status['hinweise'],
                 'auflagen': combination_status.get('auflagen', [])
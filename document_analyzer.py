@@ -1,7 +1,9 @@
+import io
 import logging
-from typing import Dict, List
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import re
 from pdf_template_manager import PDFTemplateManager
+from utils import parse_tire_size
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,6 +12,104 @@ logger = logging.getLogger(__name__)
 # Initialize template manager
 template_manager = PDFTemplateManager()
 
+class TireInfo(NamedTuple):
+    """Eine Reifengröße eines Fahrzeugs mit den Codes ihrer Dokumentzeile."""
+    groesse: str
+    codes: Dict[str, List]
+    original_line: str
+
+# Zeichenklassen für die Code-Erkennung
+# Auflagen: A12, A12a, A12.1, A-12 | T-Codes: T1 | Hinweise: B12, S01a, Car, Cou, NoE, BnK
+_HINWEIS_LETTERS = frozenset('BCDEFGHIJKLMNOPQRSUVWXYZ')
+_HINWEIS_LITERALS = frozenset(('Car', 'Cou', 'NoE', 'BnK'))
+_ASCII_DIGITS = frozenset('0123456789')
+_ASCII_LOWER = frozenset('abcdefghijklmnopqrstuvwxyz')
+# Ein Code muss am Token-Ende stehen oder von Punkt/Komma gefolgt werden
+_CODE_TERMINATORS = frozenset('.,')
+
+def _digits_end(token: str, start: int, ascii_only: bool = False) -> int:
+    """Gibt den Index nach der Ziffernfolge ab start zurück."""
+    end = start
+    length = len(token)
+    if ascii_only:
+        while end < length and token[end] in _ASCII_DIGITS:
+            end += 1
+    else:
+        while end < length and token[end].isdecimal():
+            end += 1
+    return end
+
+def _terminated(token: str, end: int) -> bool:
+    """Prüft, ob an Position end ein Code enden darf."""
+    return end == len(token) or token[end] in _CODE_TERMINATORS
+
+def _classify_token(token: str) -> Optional[Tuple[str, str]]:
+    """
+    Erkennt einen Code am Anfang eines Tokens.
+
+    Returns:
+        Tuple aus Kategorie ('auflage', 'reifen', 'hinweis') und Code oder None
+    """
+    length = len(token)
+    first = token[0]
+
+    if first == 'A':
+        if length > 1 and token[1] == '-':
+            end = _digits_end(token, 2, ascii_only=True)
+            if end > 2 and _terminated(token, end):
+                return 'auflage', token[:end]
+            return None
+        digits_end = _digits_end(token, 1, ascii_only=True)
+        if digits_end == 1:
+            return None
+        # Längste Variante zuerst: mit Kleinbuchstabe, dann ohne; jeweils mit optionalem .Unterpunkt
+        bases = [digits_end + 1, digits_end] if digits_end < length and token[digits_end] in _ASCII_LOWER else [digits_end]
+        for base in bases:
+            if base < length and token[base] == '.':
+                end = _digits_end(token, base + 1, ascii_only=True)
+                if end > base + 1 and _terminated(token, end):
+                    return 'auflage', token[:end]
+            if _terminated(token, base):
+                return 'auflage', token[:base]
+        return None
+
+    if first == 'T':
+        end = _digits_end(token, 1)
+        if end > 1 and _terminated(token, end):
+            return 'reifen', token[:end]
+        return None
+
+    if first in _HINWEIS_LETTERS:
+        end = _digits_end(token, 1)
+        if end > 1:
+            if end < length and token[end] in _ASCII_LOWER and _terminated(token, end + 1):
+                return 'hinweis', token[:end + 1]
+            if _terminated(token, end):
+                return 'hinweis', token[:end]
+            return None
+
+    # Spezialfälle ohne Ziffern
+    if token[:3] in _HINWEIS_LITERALS and _terminated(token, 3):
+        return 'hinweis', token[:3]
+    return None
+
+# Vorkompilierte Patterns für die Dokumentanalyse
+T_CODE_RE = re.compile(r'(T\d+)\s+Reifen\s+\([^)]+\)\s+zulässig\s+für\s+([^\n]+)')
+# Modellzeilen und Reifengrößen in einem Durchlauf pro Zeile erkennen
+LINE_CLASSIFIER = re.compile(
+    r'(?P<audi>Audi\s+(?P<audi_model>[A-Z][A-Z0-9\s]+))'
+    r'|(?P<tire>(?P<tire_width>\d{2,3})[/-](?P<tire_aspect>\d{2,3})(?:ZR|R)(?P<tire_diameter>\d{2}))'
+)
+CODE_DEF_RE = re.compile(r'^([A-Z]\d+[a-z]?(?:\.[0-9]+)?)\s+(.+)$')
+KENNZEICHNUNG_PATTERNS = {
+    'manufacturer': re.compile(r'Hersteller(?:zeichen)?:\s*([^\n]+)'),
+    'wheel_size': re.compile(r'Felgengröße:\s*([^\n]+)'),
+    'type_version': re.compile(r'Typ und (?:die )?Ausführung:\s*([^\n]+)'),
+    'manufacture_date': re.compile(r'Herstelldatum \((?:Monat und Jahr|month and year)\):\s*([^\n]+)'),
+    'approval_id': re.compile(r'Genehmigungszeichen:\s*([^\n]+)'),
+    'inset': re.compile(r'Einpresstiefe:\s*([^\n]+)')
+}
+
 def extract_codes_from_line(line: str) -> Dict[str, List[str]]:
     """
     Extrahiert und kategorisiert alle Codes aus einer Zeile.
@@ -20,40 +120,32 @@ def extract_codes_from_line(line: str) -> Dict[str, List[str]]:
         'reifen_codes': []
     }
 
-    # Verbesserte Patterns für Code-Erkennung
-    patterns = {
-        # Erweiterte Auflagen-Erkennung: A12, A12a, A12.1, A-12, etc.
-        'auflagen': r'(?:^|\s)(A(?:[0-9]+[a-z]?(?:\.[0-9]+)?|-[0-9]+))(?=[\s\.,]|$)',
-        # T-Codes für Reifenkombinationen
-        'reifen': r'(?:^|\s)(T\d+)(?=[\s\.,]|$)',
-        # Andere technische Codes und Spezialfälle
-        'hinweise': r'(?:^|\s)([BCDEFGHIJKLMNOPQRSUVWXYZ]\d+[a-z]?|Car|Cou|NoE|BnK)(?=[\s\.,]|$)'
-    }
-
     # Debug-Log für die Zeile
-    logger.info(f"Verarbeite Zeile: {line}")
-
-    # Extrahiere Codes für jede Kategorie
-    for category, pattern in patterns.items():
-        matches = list(re.finditer(pattern, line))
-        if matches:
-            for match in matches:
-                code = match.group(1)
-                if category == 'reifen':
-                    # Für T-Codes die komplette Beschreibung extrahieren
-                    codes['reifen_codes'].append({
-                        'code': code,
-                        'beschreibung': line.strip()
-                    })
-                elif category == 'auflagen':
-                    # Für Auflagen den Code normalisieren und speichern
-                    normalized_code = code.replace('-', '')  # Entferne mögliche Bindestriche
-                    codes['auflagen'].append(normalized_code)
-                else:
-                    codes['hinweise'].append(code)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Verarbeite Zeile: %s", line)
+
+    # Extrahiere Codes aller Kategorien token-weise
+    for token in line.split():
+        classified = _classify_token(token)
+        if classified is None:
+            continue
+        category, code = classified
+        if category == 'reifen':
+            # Für T-Codes die komplette Beschreibung extrahieren
+            codes['reifen_codes'].append({
+                'code': code,
+                'beschreibung': line.strip()
+            })
+        elif category == 'auflage':
+            # Für Auflagen den Code normalisieren und speichern
+            normalized_code = code.replace('-', '')  # Entferne mögliche Bindestriche
+            codes['auflagen'].append(normalized_code)
+        else:
+            codes['hinweise'].append(code)
 
     # Debug-Log für extrahierte Codes
-    logger.info(f"Extrahierte Codes: {codes}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Extrahierte Codes: %s", codes)
     return codes
 
 def analyze_vehicle_data(text: str) -> List[Dict]:
@@ -64,27 +156,12 @@ def analyze_vehicle_data(text: str) -> List[Dict]:
     current_vehicle = None
     current_section = None
 
-    # Updated patterns for better matching
-    patterns = {
-        'audi_header': r'Audi\s+([A-Z][A-Z0-9\s]+)',
-        'type': r'(?:B\d+(?:,\s*B\d+)*)',
-        'tire': r'(\d{2,3})[/-](\d{2,3})(?:ZR|R)(\d{2})',
-        'manufacturer': r'Hersteller(?:zeichen)?:\s*([^\n]+)',
-        'wheel_size': r'Felgengröße:\s*([^\n]+)',
-        'type_version': r'Typ und (?:die )?Ausführung:\s*([^\n]+)',
-        'manufacture_date': r'Herstelldatum \((?:Monat und Jahr|month and year)\):\s*([^\n]+)',
-        'approval_id': r'Genehmigungszeichen:\s*([^\n]+)',
-        'inset': r'Einpresstiefe:\s*([^\n]+)',
-        # Verbesserte T-Code Erkennung
-        't_code': r'(T\d+)\s+Reifen\s+\([^)]+\)\s+zulässig\s+für\s+([^\n]+)'
-    }
-
-    lines = text.split('\n')
     current_code_block = None
     code_description = []
 
-    for line in lines:
-        line = line.strip()
+    # Zeilenweise über den Text iterieren, ohne eine Liste aller Zeilen anzulegen
+    for raw_line in io.StringIO(text):
+        line = raw_line.strip()
         if not line:
             # Speichere gesammelte Code-Beschreibung
             if current_code_block and code_description:
@@ -94,7 +171,7 @@ def analyze_vehicle_data(text: str) -> List[Dict]:
             continue
 
         # Suche nach Auflagen/Hinweis-Definitionen
-        code_match = re.match(r'^([A-Z]\d+[a-z]?(?:\.[0-9]+)?)\s+(.+)$', line)
+        code_match = CODE_DEF_RE.match(line)
         if code_match:
             # Speichere vorherige Code-Beschreibung
             if current_code_block and code_description:
@@ -105,8 +182,15 @@ def analyze_vehicle_data(text: str) -> List[Dict]:
         elif current_code_block and line:
             code_description.append(line)
 
+        # Schneller Vorfilter: Reifengrößen und T-Codes enthalten immer ein 'R',
+        # Modellzeilen 'Audi' und alle Kennzeichnungen einen Doppelpunkt
+        if 'R' not in line and 'Audi' not in line and ':' not in line:
+            continue
+
+        # T-Code-Zeilen haben Vorrang; es zählt der erste T-Code der Zeile
+        t_code_match = T_CODE_RE.search(line) if 'Reifen' in line else None
+
         # Suche nach T-Code Beschreibungen
-        t_code_match = re.search(patterns['t_code'], line)
         if t_code_match:
             if current_vehicle and 'reifen_codes' not in current_vehicle:
                 current_vehicle['reifen_codes'] = []
@@ -117,13 +201,21 @@ def analyze_vehicle_data(text: str) -> List[Dict]:
                 })
             continue
 
-        # Rest der Funktion bleibt unverändert...
-        audi_match = re.search(patterns['audi_header'], line)
+        # Klassifiziere die übrigen Zeilen in einem Durchlauf (Priorität: Modell, Reifen)
+        audi_match = None
+        tire_matches = []
+        for match in LINE_CLASSIFIER.finditer(line):
+            if match.lastgroup == 'audi':
+                if audi_match is None:
+                    audi_match = match
+            else:
+                tire_matches.append(match)
+
         if audi_match:
             if current_vehicle:
                 vehicles.append(current_vehicle)
 
-            model_name = audi_match.group(1).strip()
+            model_name = audi_match.group('audi_model').strip()
             current_vehicle = {
                 'fahrzeug': f"Audi {model_name}",
                 'reifen': [],
@@ -133,22 +225,25 @@ def analyze_vehicle_data(text: str) -> List[Dict]:
             continue
 
         if current_vehicle:
-            tire_matches = list(re.finditer(patterns['tire'], line))
             if tire_matches:
+                # Alle Reifengrößen einer Zeile teilen sich deren Codes
+                codes = extract_codes_from_line(line)
                 for match in tire_matches:
-                    tire_size = f"{match.group(1)}/{match.group(2)}R{match.group(3)}"
-                    codes = extract_codes_from_line(line)
-                    current_vehicle['reifen'].append({
-                        'groesse': tire_size,
-                        'codes': codes,
-                        'original_line': line
-                    })
-
-            for key, pattern in patterns.items():
-                if key not in ['audi_header', 'type', 'tire', 't_code']:
-                    match = re.search(pattern, line)
-                    if match:
-                        current_vehicle['kennzeichnungen'][key] = match.group(1).strip()
+                    tire_size = f"{match.group('tire_width')}/{match.group('tire_aspect')}R{match.group('tire_diameter')}"
+                    current_vehicle['reifen'].append(TireInfo(tire_size, codes, line))
+
+            if ':' not in line:
+                continue
+
+            for key, pattern in KENNZEICHNUNG_PATTERNS.items():
+                match = pattern.search(line)
+                if match:
+                    current_vehicle['kennzeichnungen'][key] = match.group(1).strip()
+
+    # Ein abschließender Zeilenumbruch ergab beim zeilenweisen Aufteilen eine letzte Leerzeile,
+    # die den offenen Code-Block gespeichert hat; ohne ihn bleibt der Block wie bisher ungespeichert
+    if text.endswith('\n') and current_code_block and code_description:
+        template_manager.codes_database.setdefault('auflagen', {})[current_code_block] = ' '.join(code_description)
 
     # Füge das letzte Fahrzeug hinzu
     if current_vehicle and (len(current_vehicle['reifen']) > 0 or len(current_vehicle.get('reifen_codes', [])) > 0):
@@ -156,17 +251,30 @@ def analyze_vehicle_data(text: str) -> List[Dict]:
 
     return vehicles
 
-def validate_tire_combination(vehicle: str, tire_info: Dict) -> Dict:
+def _describe_code(code: str, desc_cache: Dict[str, Optional[str]]) -> Optional[str]:
+    """
+    Liefert die Code-Beschreibung und merkt sie sich im übergebenen Cache.
+    """
+    if code not in desc_cache:
+        desc_cache[code] = template_manager.get_code_description(code)
+    return desc_cache[code]
+
+def validate_tire_combination(vehicle: str, tire_info: TireInfo,
+                              desc_cache: Optional[Dict[str, Optional[str]]] = None) -> Dict:
     """
     Validiert eine Fahrzeug-Reifen-Kombination und prüft die zugehörigen Codes.
+    Über desc_cache können Code-Beschreibungen über mehrere Aufrufe wiederverwendet werden.
     """
-    tire = tire_info['groesse']
-    codes = tire_info.get('codes', {'auflagen': [], 'hinweise': [], 'reifen_codes': []})
-    original_line = tire_info.get('original_line', '')
+    if desc_cache is None:
+        desc_cache = {}
+
+    tire = tire_info.groesse
+    codes = tire_info.codes
+    original_line = tire_info.original_line
 
     # Validiere Reifengröße
-    match = re.match(r'(\d+)/(\d+)R(\d+)', tire)
-    if not match:
+    dimensions = parse_tire_size(tire)
+    if not dimensions:
         return {
             'status': 'Nicht zulässig',
             'hinweise': ['Ungültiges Reifenformat'],
@@ -174,7 +282,7 @@ def validate_tire_combination(vehicle: str, tire_info: Dict) -> Dict:
             'technische_hinweise': []
         }
 
-    width, aspect, diameter = map(int, match.groups())
+    width, aspect, diameter = dimensions
     validation_messages = []
 
     # Grundlegende Dimensionsprüfungen
@@ -192,7 +300,7 @@ def validate_tire_combination(vehicle: str, tire_info: Dict) -> Dict:
 
     # Verarbeite Auflagen (A-Codes)
     for code in codes['auflagen']:
-        description = template_manager.get_code_description(code)
+        description = _describe_code(code, desc_cache)
         if description:
             auflagen.append(f"{code}: {description}")
         else:
@@ -200,7 +308,7 @@ def validate_tire_combination(vehicle: str, tire_info: Dict) -> Dict:
 
     # Verarbeite Hinweise
     for code in codes['hinweise']:
-        description = template_manager.get_code_description(code)
+        description = _describe_code(code, desc_cache)
         if description:
             technische_hinweise.append(f"{code}: {description}")
         else:
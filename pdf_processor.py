@@ -1,86 +1,163 @@
-import PyPDF2
-import re
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Union
+import heapq
 import io
-
-def extract_pdf_content(pdf_file: io.BytesIO) -> Optional[str]:
+import re
+import sys
+from utils import compile_pattern, iter_pdf_page_texts
+
+# Vorkompilierte Patterns für die Fahrzeugerkennung (RE2, falls installiert).
+# Sie arbeiten auf Bytes, da alle gesuchten Merkmale im ASCII-Bereich liegen.
+# Typ und Reifen werden über den ganzen Text gesucht und dürfen daher keinen Zeilenumbruch überspannen.
+_AUDI_HEADER = compile_pattern(rb'Audi\s+([A-Z][A-Z0-9\s]+)')
+_AUDI_CANDIDATE = compile_pattern(rb'Audi[ \t\r\x0b\x0c]+[A-Z]')  # Möglicher Modell-Header
+_TYPE = compile_pattern(rb'B\d+(?:,[ \t\r\x0b\x0c]*B\d+)*')
+_TIRE = compile_pattern(rb'(\d{2,3})[/-](\d{2,3})(?:ZR|R)(\d{2})')
+
+# Leerraum, den \s auf str erkennt, auf Bytes aber nicht (z.B. geschützte Leerzeichen aus der
+# PDF-Extraktion und die ASCII-Trennzeichen \x1c-\x1f); er wird vor dem Kodieren zu ' ',
+# damit \s sich wie auf str verhält
+_UNICODE_SPACE = re.compile(r'[^\S \t\n\r\x0b\x0c]')
+
+# Formatierte Reifengrößen je (Breite, Verhältnis, Durchmesser); viele Fahrzeuge teilen dieselben Größen
+_TIRE_CACHE: Dict[tuple, str] = {}
+
+def iter_pdf_lines(pdf_file: BinaryIO) -> Iterator[str]:
     """
-    Extrahiert Text aus einem PDF-Dokument.
+    Liefert den Text eines PDF-Dokuments Seite für Seite als einzelne Zeilen.
 
     Args:
-        pdf_file: BytesIO object containing the PDF
+        pdf_file: Binary file object containing the PDF
 
     Returns:
-        Optional[str]: Extrahierter Text oder None bei Fehler
+        Iterator[str]: Zeilen aller Seiten in Dokumentreihenfolge
     """
     try:
         # Reset file pointer to beginning
         pdf_file.seek(0)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text_content = []
-
-        for page in pdf_reader.pages:
-            text_content.append(page.extract_text())
 
-        return "\n".join(text_content)
+        for page_text in iter_pdf_page_texts(pdf_file):
+            yield from page_text.split('\n')
     except Exception as e:
         raise Exception(f"Fehler beim PDF-Lesen: {str(e)}")
 
-def extract_vehicle_info(text: str) -> List[Dict]:
+def extract_pdf_content(pdf_file: BinaryIO) -> Optional[str]:
+    """
+    Extrahiert Text aus einem PDF-Dokument.
+
+    Args:
+        pdf_file: Binary file object containing the PDF
+
+    Returns:
+        Optional[str]: Extrahierter Text oder None bei Fehler
+    """
+    return "\n".join(iter_pdf_lines(pdf_file))
+
+def iter_text_lines(text: Union[str, Iterable[str]]) -> Iterable[str]:
+    """
+    Gibt die Zeilen eines Textes zurück, ohne eine Liste aller Zeilen anzulegen.
+    Bereits zeilenweise vorliegende Eingaben werden unverändert durchgereicht.
+    """
+    if isinstance(text, str):
+        return io.StringIO(text)
+    return text
+
+def _iter_header_lines(data: bytes) -> Iterator[tuple]:
+    """Liefert den Zeilenanfang jeder Zeile, die einen Modell-Header enthalten kann, einmal je Zeile."""
+    last_line_start = -1
+    for m in _AUDI_CANDIDATE.finditer(data):
+        line_start = data.rfind(b'\n', 0, m.start()) + 1
+        if line_start != last_line_start:
+            last_line_start = line_start
+            yield line_start, 0, None
+
+def _iter_vehicle_events(data: bytes) -> Iterator[tuple]:
+    """
+    Liefert Header-Kandidaten, Typen und Reifengrößen eines Textes in Dokumentreihenfolge.
+    Header-Kandidaten stehen am Zeilenanfang und kommen damit vor allen Treffern derselben Zeile.
+    """
+    headers = _iter_header_lines(data)
+    types = ((m.start(), 1, m) for m in _TYPE.finditer(data))
+    tires = ((m.start(), 2, m) for m in _TIRE.finditer(data))
+    # (Position, Art) ist eindeutig, die Match-Objekte werden nie verglichen
+    return heapq.merge(headers, types, tires)
+
+def extract_vehicle_info(text: Union[str, Iterable[str]]) -> List[Dict]:
     """
     Extrahiert Fahrzeuginformationen aus dem Text.
+    Typen und Reifengrößen werden nur mit ASCII-Ziffern erkannt (nicht z.B. mit Vollbreiten-Ziffern).
 
     Args:
-        text: Extrahierter PDF-Text
+        text: Extrahierter PDF-Text oder dessen Zeilen (z.B. aus iter_pdf_lines)
 
     Returns:
         List[Dict]: Liste von Fahrzeugdaten
     """
     vehicles = []
     current_vehicle = None
-    current_section = None
-
-    # Updated patterns for better matching
-    patterns = {
-        'audi_header': r'Audi\s+([A-Z][A-Z0-9\s]+)',
-        'type': r'(?:B\d+(?:,\s*B\d+)*)',
-        'tire': r'(\d{2,3})[/-](\d{2,3})(?:ZR|R)(\d{2})',
-    }
-
-    lines = text.split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
+    name_parts = []
+
+    if not isinstance(text, str):
+        text = '\n'.join(text)
+    # Jedes Zeichen wird zu genau einem Byte (nicht darstellbare zu '?'), die Offsets in data und text
+    # stimmen also überein; Modellname und Typ werden deshalb unverändert aus text übernommen
+    normalized = _UNICODE_SPACE.sub(' ', text)
+    data = normalized.encode('latin-1', 'replace')
+
+    # Nur Treffer werden verarbeitet; Zeilen ohne Merkmale erreichen die Python-Schleife nicht
+    skip_until = -1  # Ende der zuletzt erkannten Header-Zeile
+    type_line_end = -1  # Ende der Zeile, deren Typ bereits übernommen wurde
+    for start, kind, match in _iter_vehicle_events(data):
+        if start < skip_until:
             continue
 
-        # Check for Audi model header
-        audi_match = re.search(patterns['audi_header'], line)
-        if audi_match:
+        if kind == 0:
+            # Check for Audi model header
+            line_end = data.find(b'\n', start)
+            if line_end == -1:
+                line_end = len(data)
+            audi_match = _AUDI_HEADER.search(data[start:line_end].rstrip())
+            if not audi_match:
+                continue
+
             if current_vehicle:
+                current_vehicle['fahrzeug'] = ' '.join(name_parts)
+                current_vehicle['reifen'] = list(current_vehicle['reifen'])
                 vehicles.append(current_vehicle)
 
-            model_name = audi_match.group(1).strip()
+            model_name = text[start + audi_match.start(1):start + audi_match.end(1)].strip()
+            name_parts = ['Audi', model_name]
             current_vehicle = {
                 'fahrzeug': f"Audi {model_name}",
-                'reifen': set()
+                # dict als geordnete Menge: dedupliziert und behält die Reihenfolge im Dokument
+                'reifen': {}
             }
+            # Typen und Reifen in der Header-Zeile gehören nicht zum Fahrzeug
+            skip_until = line_end
             continue
 
-        # Check for vehicle type (B8, B81, etc.)
-        if current_vehicle and re.search(patterns['type'], line):
-            type_info = re.search(patterns['type'], line).group(0)
-            current_vehicle['fahrzeug'] = f"{current_vehicle['fahrzeug']} {type_info}"
+        if not current_vehicle:
+            continue
 
-        # Look for tire sizes in the current line
-        if current_vehicle:
-            tire_matches = re.finditer(patterns['tire'], line)
-            for match in tire_matches:
-                tire_size = f"{match.group(1)}/{match.group(2)}R{match.group(3)}"
-                current_vehicle['reifen'].add(tire_size)
+        if kind == 1:
+            # Check for vehicle type (B8, B81, etc.); nur der erste Treffer je Zeile zählt
+            if start < type_line_end:
+                continue
+            type_line_end = data.find(b'\n', start)
+            if type_line_end == -1:
+                type_line_end = len(data)
+            name_parts.append(text[start:match.end()])
+        else:
+            # Tire size
+            key = match.groups()
+            tire_size = _TIRE_CACHE.get(key)
+            if tire_size is None:
+                tire_size = _TIRE_CACHE.setdefault(key, sys.intern((b'%s/%sR%s' % key).decode('latin-1')))
+            current_vehicle['reifen'][tire_size] = None
 
     # Add the last vehicle if exists
     if current_vehicle:
         if len(current_vehicle['reifen']) > 0:
+            current_vehicle['fahrzeug'] = ' '.join(name_parts)
             current_vehicle['reifen'] = list(current_vehicle['reifen'])
             vehicles.append(current_vehicle)
 
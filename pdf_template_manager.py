@@ -1,19 +1,87 @@
 import os
 import json
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, Iterable, List, Optional, Union
 import re
-from pdf_processor import extract_pdf_content
-import io
+from pdf_processor import iter_pdf_lines, iter_text_lines
+from utils import PDF_TEXT_BACKEND
+import itertools
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# Schnelle JSON-Serialisierung; json aus der Standardbibliothek dient als Fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Vorkompilierte Patterns für Code-Klassifikation und -Extraktion. Sie arbeiten auf str und
+# bleiben bei re, da \s und \d unter RE2 nur ASCII erkennen würden.
+# Die Gruppennamen entsprechen den Kategorien: A-Codes sind Auflagen, S-, B- und F-Codes Hinweise
+_CODE_CATEGORY = re.compile(r'^(?:(?P<auflagen>A\d{2}|A[A-Z][a-z])|(?P<hinweise>[SBF]\d{2}))$')
+_HINWEIS_LITERALS = frozenset(('Car', 'Cou', 'NoE', 'BnK'))  # Spezielle Codes
+_CODE_LINE = re.compile(r'(?:^|\s)([A-Z][A-Za-z0-9]{2,})\s+([^A\n][^\n]+)')  # Allgemeines Pattern für Codes
+_CONTINUATION = re.compile(r'^(?!\s*[A-Z][A-Za-z0-9]{2,}\s)[^\n]+$')  # Fortsetzungszeilen
+
+# Version der Code-Extraktion; bei Änderungen an Extraktion oder Patterns erhöhen,
+# damit zwischengespeicherte Ergebnisse neu berechnet werden
+_EXTRACT_CACHE_VERSION = 1
+
+def _read_json(path: str):
+    """Liest eine JSON-Datei, mit orjson falls installiert."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_json(path: str, data, indent: bool = False):
+    """Schreibt eine JSON-Datei gepuffert, mit orjson falls installiert."""
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        with open(path, 'wb', buffering=65536) as f:
+            f.write(orjson.dumps(data, option=option))
+    else:
+        with open(path, 'w', encoding='utf-8', buffering=65536) as f:
+            json.dump(data, f, ensure_ascii=False, indent=2 if indent else None)
+
+@lru_cache(maxsize=8192)
+def _classify(code: str) -> Optional[str]:
+    """Kategorie eines Codes; zwischengespeichert, da dieselben Codes in allen Vorlagen vorkommen."""
+    code = code.strip()
+
+    match = _CODE_CATEGORY.match(code)
+    if match:
+        return match.lastgroup
+    if code in _HINWEIS_LITERALS:
+        return 'hinweise'
+    return None
+
+def _json_line(record: Dict) -> bytes:
+    """Serialisiert einen Datensatz als eine JSONL-Zeile."""
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+def _parse_json_line(line: bytes) -> Dict:
+    """Liest eine JSONL-Zeile, mit orjson falls installiert."""
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
 class PDFTemplateManager:
     def __init__(self, template_dir: str = "templates"):
         self.template_dir = template_dir
         self.codes_file = os.path.join(template_dir, "codes_database.json")
+        # Extrahierte Codes je Vorlage, gültig solange Änderungszeit und Größe gleich bleiben
+        self.extract_cache_file = os.path.join(template_dir, ".extract_cache.json")
+        # Änderungen seit dem letzten vollständigen Speichern, eine JSON-Zeile je Änderung
+        self.log_file = os.path.join(template_dir, "codes_database.log")
+        self._log = None
         os.makedirs(template_dir, exist_ok=True)
         self.load_codes_database()
 
@@ -21,8 +89,7 @@ class PDFTemplateManager:
         """Lädt die gespeicherte Code-Datenbank."""
         try:
             if os.path.exists(self.codes_file):
-                with open(self.codes_file, 'r', encoding='utf-8') as f:
-                    self.codes_database = json.load(f)
+                self.codes_database = _read_json(self.codes_file)
             else:
                 self.codes_database = {
                     'auflagen': {},
@@ -36,17 +103,95 @@ class PDFTemplateManager:
                 'hinweise': {},
                 'templates': []
             }
+        self._replay_log()
+        # Geladener Stand entspricht Datei und Änderungsprotokoll
+        self.dirty = False
 
-    def save_codes_database(self):
-        """Speichert die Code-Datenbank."""
+    def _replay_log(self):
+        """Wendet die protokollierten Änderungen auf die geladene Code-Datenbank an."""
+        try:
+            if not os.path.exists(self.log_file):
+                return
+            with open(self.log_file, 'rb', buffering=65536) as f:
+                for line in f:
+                    try:
+                        record = _parse_json_line(line)
+                    except ValueError:
+                        # Unvollständige letzte Zeile nach einem Abbruch beim Schreiben
+                        logger.warning("Ungültiger Eintrag im Änderungsprotokoll übersprungen")
+                        continue
+                    if record['t'] == 'add':
+                        self.codes_database[record['cat']][record['code']] = record['desc']
+                    elif record['t'] == 'template':
+                        if record['name'] not in self.codes_database['templates']:
+                            self.codes_database['templates'].append(record['name'])
+        except Exception as e:
+            logger.error(f"Fehler beim Einlesen des Änderungsprotokolls: {e}")
+
+    def _append_log(self, records: List[Dict]):
+        """Hängt Änderungen an das Protokoll an, statt die ganze Datenbank neu zu schreiben."""
+        if not records:
+            return
+        if self._log is None:
+            self._log = open(self.log_file, 'ab', buffering=65536)
+        self._log.write(b''.join(_json_line(record) for record in records))
+        self._log.flush()
+
+    def _truncate_log(self):
+        """Leert das Änderungsprotokoll, nachdem die Datenbank vollständig gespeichert wurde."""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+
+    def compact(self, force: bool = False):
+        """
+        Schreibt die Code-Datenbank vollständig und leert das Änderungsprotokoll,
+        sobald das Protokoll größer als die Hälfte der Datenbankdatei ist.
+        """
+        try:
+            log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+            db_size = os.path.getsize(self.codes_file) if os.path.exists(self.codes_file) else 0
+        except OSError as e:
+            logger.error(f"Fehler beim Prüfen des Änderungsprotokolls: {e}")
+            return
+        if force or log_size > db_size / 2:
+            self.save_codes_database(force=True)
+
+    def save_codes_database(self, force: bool = False):
+        """
+        Speichert die Code-Datenbank.
+        Ohne Änderungen seit dem letzten Laden/Speichern wird nichts geschrieben, außer mit force=True.
+        """
+        if not self.dirty and not force:
+            return
         try:
-            with open(self.codes_file, 'w', encoding='utf-8') as f:
-                json.dump(self.codes_database, f, ensure_ascii=False, indent=2)
+            _write_json(self.codes_file, self.codes_database, indent=True)
+            self._truncate_log()
+            self.dirty = False
             logger.info("Code-Datenbank erfolgreich gespeichert")
         except Exception as e:
             logger.error(f"Fehler beim Speichern der Code-Datenbank: {e}")
 
-    def classify_code(self, code: str) -> Optional[str]:
+    def _load_extract_cache(self) -> Dict[str, Dict]:
+        """Lädt den Cache der aus Vorlagen extrahierten Codes."""
+        try:
+            if os.path.exists(self.extract_cache_file):
+                return _read_json(self.extract_cache_file)
+        except Exception as e:
+            logger.error(f"Fehler beim Laden des Extraktions-Caches: {e}")
+        return {}
+
+    def _save_extract_cache(self, extract_cache: Dict[str, Dict]):
+        """Speichert den Cache der aus Vorlagen extrahierten Codes."""
+        try:
+            _write_json(self.extract_cache_file, extract_cache)
+        except Exception as e:
+            logger.error(f"Fehler beim Speichern des Extraktions-Caches: {e}")
+
+    @staticmethod
+    def classify_code(code: str) -> Optional[str]:
         """
         Klassifiziert einen Code als Auflage oder Hinweis.
 
@@ -56,26 +201,20 @@ class PDFTemplateManager:
         Returns:
             Optional[str]: 'auflagen' oder 'hinweise' oder None bei ungültigem Code
         """
-        code = code.strip()
-
-        # Auflagen-Patterns (A-Codes)
-        if re.match(r'^A\d{2}$', code) or re.match(r'^A[A-Z][a-z]$', code):
-            return 'auflagen'
-
-        # Hinweis-Patterns
-        if any([
-            re.match(r'^S\d{2}$', code),  # S-Codes
-            re.match(r'^B\d{2}$', code),  # B-Codes
-            re.match(r'^F\d{2}$', code),  # F-Codes
-            code in ['Car', 'Cou', 'NoE', 'BnK']  # Spezielle Codes
-        ]):
-            return 'hinweise'
+        return _classify(code)
 
-        return None
+    @classmethod
+    def _finalize_code(cls, codes: Dict[str, Dict[str, str]], code: Optional[str], description: List[str]):
+        """Übernimmt einen vollständig gelesenen Code; die Beschreibung wird dabei einmal zusammengefügt."""
+        if code and description:
+            category = cls.classify_code(code)
+            if category:
+                codes[category][code] = ' '.join(description)
 
-    def extract_codes_from_text(self, text: str) -> Dict[str, Dict[str, str]]:
+    @classmethod
+    def extract_codes_from_text(cls, text: Union[str, Iterable[str]]) -> Dict[str, Dict[str, str]]:
         """
-        Extrahiert Codes und deren Beschreibungen aus dem Text.
+        Extrahiert Codes und deren Beschreibungen aus dem Text oder dessen Zeilen.
         Erkennt automatisch neue Codes und ihre Beschreibungen.
         """
         codes = {
@@ -83,83 +222,63 @@ class PDFTemplateManager:
             'hinweise': {}
         }
 
-        # Verbesserte Pattern für Code-Beschreibungen
-        patterns = {
-            'code_line': r'(?:^|\s)([A-Z][A-Za-z0-9]{2,})\s+([^A\n][^\n]+)',  # Allgemeines Pattern für Codes
-            'continuation': r'^(?!\s*[A-Z][A-Za-z0-9]{2,}\s)[^\n]+$'  # Fortsetzungszeilen
-        }
-
         current_code = None
         current_description = []
 
-        for line in text.split('\n'):
+        for line in iter_text_lines(text):
             line = line.strip()
             if not line:
-                if current_code and current_description:
-                    category = self.classify_code(current_code)
-                    if category:
-                        codes[category][current_code] = ' '.join(current_description)
-                    current_code = None
-                    current_description = []
+                cls._finalize_code(codes, current_code, current_description)
+                current_code = None
+                current_description = []
                 continue
 
             # Suche nach neuen Code-Definitionen
-            code_match = re.match(patterns['code_line'], line)
+            code_match = _CODE_LINE.match(line)
             if code_match:
                 # Speichere vorherigen Code falls vorhanden
-                if current_code and current_description:
-                    category = self.classify_code(current_code)
-                    if category:
-                        codes[category][current_code] = ' '.join(current_description)
+                cls._finalize_code(codes, current_code, current_description)
 
                 current_code = code_match.group(1)
                 current_description = [code_match.group(2).strip()]
 
             # Prüfe auf Fortsetzungszeilen
-            elif current_code and re.match(patterns['continuation'], line):
+            elif current_code and _CONTINUATION.match(line):
                 current_description.append(line)
 
         # Letzten Code hinzufügen
-        if current_code and current_description:
-            category = self.classify_code(current_code)
-            if category:
-                codes[category][current_code] = ' '.join(current_description)
+        cls._finalize_code(codes, current_code, current_description)
 
         return codes
 
-    def learn_from_pdf(self, pdf_content: io.BytesIO, template_name: str) -> bool:
+    def learn_from_pdf(self, pdf_content: BinaryIO, template_name: str) -> bool:
         """
         Lernt Codes und deren Beschreibungen aus einer PDF-Vorlage.
         """
         try:
-            text = extract_pdf_content(pdf_content)
-            if not text:
+            new_codes = _extract_template_codes(pdf_content)
+            if new_codes is None:
                 logger.error("Kein Text aus PDF extrahiert")
                 return False
 
             logger.info(f"Verarbeite Template: {template_name}")
-            new_codes = self.extract_codes_from_text(text)
-
-            # Statistiken für Logging
-            stats = {'new': 0, 'updated': 0}
-
-            # Aktualisiere die Datenbank mit neuen Codes
-            for category in ['auflagen', 'hinweise']:
-                for code, description in new_codes[category].items():
-                    if code not in self.codes_database[category]:
-                        logger.info(f"Neuer {category}-Code gefunden: {code}")
-                        self.codes_database[category][code] = description
-                        stats['new'] += 1
-                    elif self.codes_database[category][code] != description:
-                        logger.info(f"Aktualisiere Beschreibung für {code}")
-                        self.codes_database[category][code] = description
-                        stats['updated'] += 1
-
-            # Füge Template zur Liste hinzu
-            if template_name not in self.codes_database['templates']:
-                self.codes_database['templates'].append(template_name)
-
-            self.save_codes_database()
+            # Das Protokoll enthält nur die Änderungen dieser Vorlage; ältere ungespeicherte Änderungen
+            # (z.B. nach einem fehlgeschlagenen Speichern) erfordern ein vollständiges Speichern
+            was_dirty = self.dirty
+            changes = []
+            stats = self._merge_codes(new_codes, template_name, changes)
+
+            if was_dirty:
+                self.save_codes_database()
+            else:
+                # Nur die Änderungen anhängen; die Datenbankdatei wird erst beim Kompaktieren neu geschrieben
+                try:
+                    self._append_log(changes)
+                    self.dirty = False
+                except OSError as e:
+                    logger.error(f"Fehler beim Schreiben des Änderungsprotokolls: {e}")
+                    self.save_codes_database()
+            self.compact()
             logger.info(f"Template verarbeitet: {stats['new']} neue Codes, {stats['updated']} aktualisierte Codes")
             return True
 
@@ -167,6 +286,46 @@ class PDFTemplateManager:
             logger.error(f"Fehler beim Lernen aus PDF: {str(e)}")
             return False
 
+    def _merge_codes(self, new_codes: Dict[str, Dict[str, str]], template_name: str,
+                     changes: Optional[List[Dict]] = None) -> Dict[str, int]:
+        """
+        Übernimmt extrahierte Codes einer Vorlage in die Code-Datenbank.
+        Jede Änderung wird zusätzlich als Protokolleintrag an changes angehängt, falls angegeben.
+
+        Returns:
+            Dict[str, int]: Anzahl neuer und aktualisierter Codes
+        """
+        # Statistiken für Logging
+        stats = {'new': 0, 'updated': 0}
+
+        # Aktualisiere die Datenbank mit neuen Codes
+        # (Log-Meldungen werden nur formatiert, wenn sie tatsächlich ausgegeben werden)
+        for category in ['auflagen', 'hinweise']:
+            for code, description in new_codes[category].items():
+                if code not in self.codes_database[category]:
+                    logger.info("Neuer %s-Code gefunden: %s", category, code)
+                    self.codes_database[category][code] = description
+                    stats['new'] += 1
+                    self.dirty = True
+                    if changes is not None:
+                        changes.append({'t': 'add', 'cat': category, 'code': code, 'desc': description})
+                elif self.codes_database[category][code] != description:
+                    logger.info("Aktualisiere Beschreibung für %s", code)
+                    self.codes_database[category][code] = description
+                    stats['updated'] += 1
+                    self.dirty = True
+                    if changes is not None:
+                        changes.append({'t': 'add', 'cat': category, 'code': code, 'desc': description})
+
+        # Füge Template zur Liste hinzu
+        if template_name not in self.codes_database['templates']:
+            self.codes_database['templates'].append(template_name)
+            self.dirty = True
+            if changes is not None:
+                changes.append({'t': 'template', 'name': template_name})
+
+        return stats
+
     def get_code_description(self, code: str) -> Optional[str]:
         """
         Gibt die Beschreibung für einen Code zurück.
@@ -194,23 +353,90 @@ class PDFTemplateManager:
                 'hinweise': {},
                 'templates': []
             }
+            self.dirty = True
 
             template_files = [f for f in os.listdir(self.template_dir) if f.endswith('.pdf')]
 
-            for template_file in template_files:
-                template_path = os.path.join(self.template_dir, template_file)
-                logger.info(f"Lese Vorlage neu ein: {template_file}")
-
-                try:
-                    with open(template_path, 'rb') as f:
-                        pdf_content = io.BytesIO(f.read())
-                        self.learn_from_pdf(pdf_content, template_file)
-                except Exception as e:
-                    logger.error(f"Fehler beim Einlesen der Vorlage {template_file}: {e}")
-                    continue
+            if template_files:
+                extract_cache = self._load_extract_cache()
+                new_extract_cache = {}
+
+                # PDF-Extraktion parallel, Zusammenführung sequentiell in Dateireihenfolge
+                max_workers = min(len(template_files), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {}
+                    for template_file in template_files:
+                        template_path = os.path.join(self.template_dir, template_file)
+                        try:
+                            file_stat = os.stat(template_path)
+                        except OSError as e:
+                            # Zwischenzeitlich entfernte oder unlesbare Vorlagen überspringen
+                            logger.error(f"Fehler beim Einlesen der Vorlage {template_file}: {e}")
+                            continue
+                        cache_key = {
+                            'mtime_ns': file_stat.st_mtime_ns,
+                            'size': file_stat.st_size,
+                            'version': _EXTRACT_CACHE_VERSION,
+                            'backend': PDF_TEXT_BACKEND
+                        }
+
+                        # Unveränderte Vorlagen nicht erneut einlesen
+                        cached = extract_cache.get(template_file)
+                        if cached and cached.get('key') == cache_key:
+                            new_extract_cache[template_file] = cached
+                        else:
+                            new_extract_cache[template_file] = {'key': cache_key}
+                            futures[template_file] = executor.submit(_extract_codes_for_file, template_path)
+
+                    for template_file in template_files:
+                        if template_file not in new_extract_cache:
+                            continue
+                        logger.info(f"Lese Vorlage neu ein: {template_file}")
+
+                        if template_file in futures:
+                            try:
+                                new_extract_cache[template_file]['codes'] = futures[template_file].result()
+                            except Exception as e:
+                                del new_extract_cache[template_file]
+                                logger.error(f"Fehler beim Einlesen der Vorlage {template_file}: {e}")
+                                continue
+                        else:
+                            logger.info(f"Vorlage unverändert, verwende Cache: {template_file}")
+
+                        new_codes = new_extract_cache[template_file]['codes']
+                        if new_codes is None:
+                            logger.error(f"Kein Text aus Vorlage {template_file} extrahiert")
+                            continue
+
+                        stats = self._merge_codes(new_codes, template_file)
+                        logger.info(f"Template verarbeitet: {stats['new']} neue Codes, {stats['updated']} aktualisierte Codes")
+
+                # Einmal am Ende statt nach jeder Vorlage speichern
+                self.save_codes_database()
+                self._save_extract_cache(new_extract_cache)
 
             logger.info(f"Vorlagen-Reload abgeschlossen: {len(template_files)} Vorlagen verarbeitet")
             return True
         except Exception as e:
             logger.error(f"Fehler beim Reload der Vorlagen: {e}")
-            return False
\ No newline at end of file
+            return False
+
+def _extract_template_codes(pdf_content: BinaryIO) -> Optional[Dict[str, Dict[str, str]]]:
+    """
+    Extrahiert die Codes einer PDF-Vorlage.
+    Gibt None zurück, wenn das PDF keinen Text enthält.
+    """
+    lines = iter_pdf_lines(pdf_content)
+    # Führende Leerzeilen haben keinen Einfluss auf die Code-Extraktion
+    first_line = next((line for line in lines if line.strip()), None)
+    if first_line is None:
+        return None
+    return PDFTemplateManager.extract_codes_from_text(itertools.chain([first_line], lines))
+
+def _extract_codes_for_file(template_path: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """
+    Worker für reload_templates: liest eine Vorlage von der Platte und extrahiert ihre Codes.
+    """
+    # Die Datei direkt an den PDF-Parser geben statt sie vorher komplett zu kopieren
+    with open(template_path, 'rb', buffering=65536) as f:
+        return _extract_template_codes(f)
@@ -1,7 +1,85 @@
-from typing import List, Dict
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from functools import lru_cache
 import io
+import re
 import PyPDF2
 
+# Schnelle Textextraktion über PDFium; PyPDF2 dient als Fallback
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# Verwendete Textextraktion; bestimmt mit, welchen Text Vorlagen liefern
+PDF_TEXT_BACKEND = 'pdfium' if pdfium is not None else 'pypdf2'
+
+# Optionale DFA-basierte Regex-Engine (pip install google-re2)
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+def compile_pattern(pattern: bytes):
+    """
+    Kompiliert ein Bytes-Pattern mit RE2, falls installiert, sonst mit dem re-Modul.
+    Nur für Bytes: dort erkennen \s und \d in beiden Engines nur ASCII, bei str-Patterns
+    würde das Ergebnis davon abhängen, ob RE2 installiert ist.
+    Patterns mit Syntax, die RE2 nicht unterstützt (z.B. Lookarounds), nutzen immer re.
+
+    Args:
+        pattern: Regulärer Ausdruck als bytes
+
+    Returns:
+        Kompiliertes Pattern mit search/match/finditer-Schnittstelle
+    """
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern)
+
+# Typische KBA/ABE Dokumentenmerkmale
+_KBA_INDICATORS = (
+    'kraftfahrt-bundesamt',
+    'abe',
+    'allgemeine betriebserlaubnis',
+    'typgenehmigung',
+    'gutachten'
+)
+# Für die Rohdaten nur mehrwortige Merkmale: 'abe' kommt auch in PDF-Strukturen (/PageLabels)
+# und zufällig in komprimierten Streams vor
+_KBA_INDICATORS_RAW = tuple(indicator.encode('ascii') for indicator in _KBA_INDICATORS if indicator != 'abe')
+
+def iter_pdf_page_texts(pdf_file: BinaryIO) -> Iterator[str]:
+    """
+    Liefert den Text jeder Seite, mit PDFium falls installiert, sonst mit PyPDF2.
+    Seiten werden erst beim Weiterlesen extrahiert; wer nur die erste Seite braucht, liest nur diese.
+
+    Args:
+        pdf_file: Binary file object containing the PDF
+
+    Returns:
+        Iterator[str]: Text der Seiten in Dokumentreihenfolge
+    """
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(pdf_file)
+        try:
+            for page in pdf:
+                textpage = page.get_textpage()
+                try:
+                    # PDFium trennt Zeilen mit \r\n
+                    yield textpage.get_text_range().replace('\r\n', '\n')
+                finally:
+                    textpage.close()
+                    page.close()
+        finally:
+            pdf.close()
+    else:
+        pdf_reader = PyPDF2.PdfReader(pdf_file, strict=False)
+        for page in pdf_reader.pages:
+            yield page.extract_text()
+
 def validate_pdf(pdf_file: io.BytesIO) -> bool:
     """
     Überprüft, ob es sich um ein gültiges KBA/ABE PDF handelt.
@@ -15,25 +93,34 @@ def validate_pdf(pdf_file: io.BytesIO) -> bool:
     try:
         # Reset file pointer to beginning
         pdf_file.seek(0)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        first_page = pdf_reader.pages[0].extract_text().lower()
+        head = pdf_file.read(65536)
+        pdf_file.seek(0)
+
+        # Ohne PDF-Header (laut Spezifikation in den ersten 1024 Bytes) ist es kein PDF
+        if b'%PDF-' not in head[:1024]:
+            return False
+
+        # Unkomprimiert gespeicherte Merkmale finden sich schon in den Rohdaten; nur sonst den Parser bemühen
+        head = head.lower()
+        if any(indicator in head for indicator in _KBA_INDICATORS_RAW):
+            return True
+
+        pages = iter_pdf_page_texts(pdf_file)
+        try:
+            first_page = next(pages, '').lower()
+        finally:
+            pages.close()
 
         # Reset file pointer again for future reads
         pdf_file.seek(0)
 
-        # Typische KBA/ABE Dokumentenmerkmale
-        kba_indicators = [
-            'kraftfahrt-bundesamt',
-            'abe',
-            'allgemeine betriebserlaubnis',
-            'typgenehmigung',
-            'gutachten'
-        ]
-
-        return any(indicator in first_page for indicator in kba_indicators)
+        return any(indicator in first_page for indicator in _KBA_INDICATORS)
     except:
         return False
 
+# Gemeinsamer Platzhalter für Ergebnisse ohne Original-Codes; darf nicht verändert werden
+_EMPTY_CODES = {'auflagen': [], 'hinweise': []}
+
 def format_results(results: List[Dict]) -> List[Dict]:
     """
     Formatiert die Analyseergebnisse für die Anzeige.
@@ -44,17 +131,36 @@ def format_results(results: List[Dict]) -> List[Dict]:
     Returns:
         List[Dict]: Formatierte Ergebnisse
     """
-    formatted = []
+    return [{
+        'Fahrzeug': result['fahrzeug'],
+        'Reifengröße': result['reifengroesse'],
+        'Status': result['status'],
+        'Hinweise': result['hinweise'],
+        'Auflagen': result.get('auflagen', []),
+        'Technische_Hinweise': result.get('technische_hinweise', []),
+        'Original_Codes': result.get('original_codes', _EMPTY_CODES)
+    } for result in results]
+
+@lru_cache(maxsize=1024)
+def parse_tire_size(tire: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Zerlegt eine Reifengröße im Format "225/50R17" in ihre Dimensionen.
+
+    Args:
+        tire: Reifengröße
+
+    Returns:
+        Optional[Tuple[int, int, int]]: Breite, Höhen-Breiten-Verhältnis und Felgendurchmesser
+        oder None bei ungültigem Format
+    """
+    width, sep, rest = tire.partition('/')
+    aspect, sep_r, rest = rest.partition('R')
 
-    for result in results:
-        formatted.append({
-            'Fahrzeug': result['fahrzeug'],
-            'Reifengröße': result['reifengroesse'],
-            'Status': result['status'],
-            'Hinweise': result['hinweise'],
-            'Auflagen': result.get('auflagen', []),
-            'Technische_Hinweise': result.get('technische_hinweise', []),
-            'Original_Codes': result.get('original_codes', {'auflagen': [], 'hinweise': []})
-        })
+    # Nachfolgende Zusätze (z.B. Lastindex) hinter dem Durchmesser ignorieren
+    end = 0
+    while end < len(rest) and rest[end].isdecimal():
+        end += 1
 
-    return formatted
\ No newline at end of file
+    if not (sep and sep_r and end and width.isdecimal() and aspect.isdecimal()):
+        return None
+    return int(width), int(aspect), int(rest[:end])